@@ -1,55 +1,78 @@
-from flask import Flask, jsonify, render_template_string
-import requests
-import json
+from flask import Flask, jsonify, request
+from waitress import serve
+import httpx
+import orjson
+import asyncio
 import threading
+import hashlib
 import time
+import traceback
 import os
-from datetime import datetime, timedelta
-from decimal import Decimal, ROUND_HALF_UP
+from collections import deque
+from datetime import datetime
 
 app = Flask(__name__)
 
 URL = "https://platform-v2.ridges.ai/retrieval/top-agents"
 PARAMS = {"number_of_agents": 50}
+THRESHOLD = int(os.getenv("THRESHOLD_SCORE", "0"))
+INTERVAL_SEC = 600  # Poll on every 10-minute mark
+LOG_MAXLEN = 1440  # 10 days of history at one entry per 10 minutes
 
-# Global variables to store data in memory
-agents_data = {}  # {agent_id: score}
-diff_log = []     # [{"timestamp": str, "total_diff": int}, ...]
-data_lock = threading.Lock()  # Thread safety
+# Event loop for the background poller; runs in its own daemon thread
+LOOP = asyncio.new_event_loop()
 
-
-def round_half_up(value: float) -> int:
-    """Round float to nearest integer (standard rounding)."""
-    return int(Decimal(value).to_integral_value(rounding=ROUND_HALF_UP))
-
-
-def load_existing_agents():
-    """Load existing agents from global variable."""
-    with data_lock:
-        return agents_data.copy()
+# Global variables to store data in memory.
+# No lock: background_task is the single writer. It is the only code touching
+# diff_ts/diff_val, and it publishes agent_id_set and cached_json by reference
+# assignment (atomic under the GIL). Request handlers only read those references.
+# Add a lock back if a second writer is ever introduced.
+agent_id_set: frozenset[str] = frozenset()  # Replaced wholesale, never mutated
+diff_ts: deque[str] = deque(maxlen=LOG_MAXLEN)   # Log timestamps
+diff_val: deque[int] = deque(maxlen=LOG_MAXLEN)  # total_diff per timestamp, same index
+cached_json: bytes = orjson.dumps({"timestamps": [], "diffs": []})  # Encoded /data.json body
 
 
 def append_log(timestamp: str, total_diff: int):
-    """Append total_diff and timestamp to global log."""
-    with data_lock:
-        diff_log.append({"timestamp": timestamp, "total_diff": total_diff})
-
-
-def fetch_and_save():
+    """Append total_diff and timestamp to global log and republish the /data.json body."""
+    global cached_json
+    diff_ts.append(timestamp)
+    diff_val.append(total_diff)
+    cached_json = orjson.dumps({"timestamps": list(diff_ts), "diffs": list(diff_val)})
+
+
+def make_client() -> httpx.AsyncClient:
+    """Create the HTTP/2 client shared by all polls (keeps the connection alive)."""
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=4),
+        retries=2,
+    )
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(10.0, connect=3.0),
+        headers={"Accept-Encoding": "gzip"},
+    )
+
+
+async def fetch_and_save(client: httpx.AsyncClient):
     """Fetch new agents, compute total_diff, update global variables, and log result."""
-    global agents_data
+    global agent_id_set
     try:
-        response = requests.get(URL, params=PARAMS, timeout=30)
+        try:
+            response = await client.get(URL, params=PARAMS)
+        except httpx.RemoteProtocolError:
+            # Server closed the idle keep-alive connection; retry once on a fresh one
+            response = await client.get(URL, params=PARAMS)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
 
-        threshold = int(os.getenv("THRESHOLD_SCORE", "0"))
-        existing = load_existing_agents()
-        new_agents = {}
+        existing_ids = agent_id_set
+        new_ids = set()
         total_diff = 0
 
         for item in data:
-            if not isinstance(item, dict):
+            if type(item) is not dict:
                 continue
 
             agent_id = item.get("agent_id")
@@ -58,22 +81,24 @@ def fetch_and_save():
             if agent_id is None or score is None:
                 continue
 
-            int_score = round_half_up(float(score) * 100)
-            new_agents[agent_id] = int_score
+            if type(score) is not float:
+                score = float(score)
+            # Round half up; final_score is non-negative so int() truncation is safe
+            int_score = int(score * 100 + 0.5)
+            new_ids.add(agent_id)
 
-            if agent_id not in existing:
-                diff = int_score - threshold
+            if agent_id not in existing_ids:
+                diff = int_score - THRESHOLD
                 total_diff += diff
 
-        # Update global variable with new agents
-        with data_lock:
-            agents_data = new_agents
+        # Publish new snapshot (reference assignment is atomic, so no lock needed)
+        agent_id_set = frozenset(new_ids)
 
         # Log result
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         append_log(timestamp, total_diff)
 
-        print(f"[{timestamp}] Saved {len(new_agents)} agents to memory")
+        print(f"[{timestamp}] Saved {len(new_ids)} agents to memory")
         print(f"  → Sum of (rounded_score - threshold) for new agents = {total_diff}")
 
     except Exception as e:
@@ -81,58 +106,63 @@ def fetch_and_save():
 
 
 def sleep_until_next_10min():
-    """Sleep until the next exact 10-minute mark."""
-    now = datetime.now()
-    next_minute = (now.minute // 10 + 6) * 10
-    if next_minute >= 60:
-        next_time = (now + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
-    else:
-        next_time = now.replace(minute=next_minute, second=0, microsecond=0)
-    return (next_time - now).total_seconds()
+    """Return seconds until the next exact 10-minute mark."""
+    return INTERVAL_SEC - time.time() % INTERVAL_SEC
 
 
-def background_task():
+async def background_task():
     """Run fetch_and_save() every 10-minute mark."""
-    while True:
-        fetch_and_save()
-        sleep_sec = sleep_until_next_10min()
-        print(f"[INFO] Sleeping for {int(sleep_sec)} seconds until next 10-min mark...")
-        time.sleep(sleep_sec)
-
-
-@app.route("/")
-def index():
-    """Frontend: show chart of total_diff over time."""
-    # Load data from global variable
-    timestamps, diffs = [], []
-    with data_lock:
-        for entry in diff_log:
-            timestamps.append(entry["timestamp"])
-            diffs.append(entry["total_diff"])
-
-    html = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Total Diff Chart</title>
-        <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-        <style>
-            body { font-family: Arial, sans-serif; text-align: center; padding: 40px; background: #fafafa; }
-            canvas { max-width: 800px; margin: 20px auto; display: block; }
-        </style>
-    </head>
-    <body>
-        <h2>Total Diff Over Time</h2>
-        <canvas id="diffChart"></canvas>
-        <script>
+    async with make_client() as client:
+        while True:
+            await fetch_and_save(client)
+            sleep_sec = sleep_until_next_10min()
+            print(f"[INFO] Sleeping for {int(sleep_sec)} seconds until next 10-min mark...")
+            await asyncio.sleep(sleep_sec)
+
+
+def report_background_failure(future):
+    """Print the error that stopped background_task(), if it died."""
+    if future.cancelled():
+        return
+    exc = future.exception()
+    if exc is not None:
+        print(f"[ERROR] Background task stopped: {exc!r}")
+        traceback.print_exception(exc)
+
+
+def start_background_loop():
+    """Start the event loop thread and schedule background_task() on it."""
+    thread = threading.Thread(target=LOOP.run_forever, daemon=True)
+    thread.start()
+    future = asyncio.run_coroutine_threadsafe(background_task(), LOOP)
+    future.add_done_callback(report_background_failure)
+    return future
+
+
+INDEX_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Total Diff Chart</title>
+    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
+    <style>
+        body { font-family: Arial, sans-serif; text-align: center; padding: 40px; background: #fafafa; }
+        canvas { max-width: 800px; margin: 20px auto; display: block; }
+    </style>
+</head>
+<body>
+    <h2>Total Diff Over Time</h2>
+    <canvas id="diffChart"></canvas>
+    <script>
+        function render(payload) {
             const ctx = document.getElementById('diffChart').getContext('2d');
-            const chart = new Chart(ctx, {
+            new Chart(ctx, {
                 type: 'line',
                 data: {
-                    labels: {{ timestamps | safe }},
+                    labels: payload.timestamps,
                     datasets: [{
                         label: 'Total Diff',
-                        data: {{ diffs | safe }},
+                        data: payload.diffs,
                         borderColor: 'rgba(75, 192, 192, 1)',
                         borderWidth: 2,
                         fill: false,
@@ -146,11 +176,30 @@ def index():
                     }
                 }
             });
-        </script>
-    </body>
-    </html>
-    """
-    return render_template_string(html, timestamps=timestamps, diffs=diffs)
+        }
+
+        fetch('/data.json').then(r => r.json()).then(render);
+    </script>
+</body>
+</html>
+"""
+INDEX_ETAG = hashlib.sha1(INDEX_HTML.encode()).hexdigest()
+
+
+@app.route("/")
+def index():
+    """Frontend: static chart page that loads its data from /data.json."""
+    response = app.response_class(INDEX_HTML, mimetype="text/html")
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    response.set_etag(INDEX_ETAG)
+    return response.make_conditional(request)
+
+
+@app.route("/data.json")
+def data_json():
+    """Chart data: timestamps and total_diff values from the in-memory log."""
+    return app.response_class(cached_json, mimetype="application/json")
 
 
 @app.route("/status")
@@ -166,9 +215,8 @@ def status():
 
 if __name__ == "__main__":
     # Start background worker
-    thread = threading.Thread(target=background_task, daemon=True)
-    thread.start()
+    start_background_loop()
 
-    # Run Flask web server
-    app.run(host="0.0.0.0", port=5000)
+    # Run production WSGI server
+    serve(app, host="0.0.0.0", port=5000, threads=4, connection_limit=200)
 